@@ -1,33 +1,140 @@
 # Time series analysis of corrosion rate (dataInhibitor)
 
+import hashlib
+import itertools
 import os
+import pickle
+import sys
+import time
+import zlib
+from collections import OrderedDict
 
 import matplotlib
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 import seaborn as sns
+from joblib import Parallel, delayed
 from matplotlib.ticker import FormatStrFormatter
+from sklearn.base import BaseEstimator, RegressorMixin, clone
 from sklearn.compose import make_column_transformer
 from sklearn.ensemble import RandomForestRegressor
-from sklearn.metrics import r2_score, mean_squared_error, mean_absolute_error
-from sklearn.model_selection import cross_val_score
-from sklearn.neighbors import KNeighborsRegressor
+from sklearn.linear_model import LinearRegression
+from sklearn.metrics import get_scorer, r2_score, mean_squared_error, mean_absolute_error
+from sklearn.metrics.pairwise import rbf_kernel
+from sklearn.model_selection import KFold, cross_val_score
+from sklearn.neighbors import KNeighborsRegressor, NearestNeighbors
 from sklearn.neural_network import MLPRegressor
 from sklearn.preprocessing import OneHotEncoder, StandardScaler
 from sklearn.svm import SVR
+from sklearn.tree import DecisionTreeRegressor
 from sklearn.utils import shuffle
 from sklearn.inspection import permutation_importance
-
+from threadpoolctl import threadpool_limits
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa, pq = None, None
+try:
+    import tomllib
+except ImportError:
+    tomllib = None
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+plot_rc = {'font.family': 'Times New Roman', 'axes.linewidth': 1.5}
 matplotlib.use('Agg')
-matplotlib.rcParams['font.family'] = "Times New Roman"
-matplotlib.rcParams['axes.linewidth'] = 1.5
+matplotlib.rcParams.update(plot_rc)
 target = {'regression': 'corrosion_mm_yr'}
 
 # ----------------------------------------------------------------------------------------------------------------------
 # Variables
 # ----------------------------------------------------------------------------------------------------------------------
-param = dict(test_size=0.25, cv=5, scoring='mse', replicas=10, grid_search=False, compare_models=False)
+param_defaults = dict(test_size=0.25, cv=5, scoring='mse', replicas=10, grid_search=False, compare_models=False,
+                      time_features=False, feature_window=3, intervals=False, quantile_forest=False,
+                      quantiles=[0.05, 0.95], chunk_size=10000, n_jobs=-1, scenario_sweep=False, sweep_all=False,
+                      sweep_chunk_size=100000, max_memory_mb=1024, compaction=False, compaction_tolerance=0.05,
+                      ensemble=False, ensemble_mode='stacking', monitor=True, monitor_strict=True, seed=5,
+                      mlp_pool=True, blas_threads=1, mlp_early_stopping=False, mlp_patience=10, knn_index=True,
+                      svm_kernel_cache=True, kernel_cache_mb=512)
+cat_index = ['pre_concentration_zero', 'CI', 'pH', 'Brine_Type', 'Type_of_test']
+num_index = ['Pressure_bar_CO2', 'Temperature_C', 'Shear_Pa', 'Brine_Ionic_Strength']
+monitor_numeric = num_index + ['concentration_ppm', 'time_hrs', 'corrosion_mm_yr', 'initial_corrosion_mm_yr']
+monitor_categorical = ['Lab', 'CI', 'pH', 'Brine_Type', 'Type_of_test']
+# test conditions are fixed per experiment (or dose step): checked for range and unseen levels sheet by sheet;
+# the PSI only looks at columns that vary within a sheet, over the whole ingested campaign
+monitor_levels = num_index + ['concentration_ppm']
+monitor_varying = ['time_hrs', 'corrosion_mm_yr']
+grid_defaults = {'hp1': {'MLP': [(2,), (4,), (6,), (8,), (10,),
+                                 (2, 2), (4, 4), (6, 6), (8, 8), (10, 10),
+                                 (2, 2, 2), (4, 4, 4), (6, 6, 6), (8, 8, 8), (10, 10, 10),
+                                 (2, 2, 2, 2), (4, 4, 4, 4), (6, 6, 6, 6), (8, 8, 8, 8), (10, 10, 10, 10),
+                                 (2, 2, 2, 2, 2), (4, 4, 4, 4, 4), (6, 6, 6, 6, 6), (8, 8, 8, 8, 8),
+                                 (10, 10, 10, 10, 10)],
+                         'SVM': [1, 0.1, 0.01, 0.001, 0.0001],
+                         'RF': [10, 50, 100, 200, 500],
+                         'KNN': [1, 2, 3, 4, 5, 6, 7]},
+                 'hp2': {'MLP': ['constant'],
+                         'SVM': [1, 5, 10, 100, 1000],
+                         'RF': [0.6, 0.7, 0.8, 0.9, 1.0],
+                         'KNN': ['uniform', 'distance']}}
+models_defaults = {'MLP': dict(hidden_layer_sizes=(8, 8, 8, 8), max_iter=10000, random_state=5),
+                   'SVM': dict(C=1000, gamma=1),
+                   'RF': dict(max_features=0.7, n_estimators=500, random_state=5),
+                   'KNN': dict(n_neighbors=3, weights='distance')}
+features_defaults = {'CI': [['CORR12148SP', 'EC1612A'], [0.0, 0.0], 'Corrosion inhibitor', 'CI', ''],
+                     'pH': [['Controlled=6', 'Uncontrolled'], [0.0, 0.0], 'pH', 'pH', ''],
+                     'Brine_Type': [['TH', 'Galapagos'], [0.0, 0.0], 'Brine type', 'type', ''],
+                     'Pressure_bar_CO2': [[0.5, 5, 12], [4.51, 3.15], 'CO2 partial pressure', 'P_CO2', 'bar'],
+                     'Temperature_C': [[90, 110, 132], [106.69, 19.34], 'Temperature', 'T', 'C'],
+                     'Shear_Pa': [[20, 100, 300], [32.85, 56.01], 'Shear stress', 'P', 'Pa'],  # mean, sdv
+                     'Brine_Ionic_Strength': [[0.5, 1.5, 2.5], [0.87, 0.62], 'Brine ionic strength', 'S', ''],
+                     'concentration_ppm': [[100, 200, 300], [190.21, 131.99],
+                                           'Inhibitor concentration', 'C', 'ppm']}
+replica_defaults = {'off': [(5, 'Test 5'), (5, 'Test 6'), (5, 'Test 7'), (5, 'Test 8'),  # Experiment 5 is out
+                            (19, 'SD 43'), (19, 'SD 44'), (19, 'SD 45'), (19, 'SD 46'),  # Experiment 19 is out
+                            (22, 'SD 53'), (22, 'SD 54'),  # Experiment 22 is out
+                            (25, 'NP 8'), (25, 'NP 9'), (25, 'NP 10'), (25, 'NP 11')],  # Experiment 25 is out
+                    'representative': [(6, 'Test 10'), (6, 'Test 11'),
+                                       (7, 'Test 12'), (7, 'Test 14'),
+                                       (8, 'Test 16'),
+                                       (9, 'Test 18'),
+                                       (10, 'Test 19'), (10, 'Test 20'), (10, 'Test 21'),
+                                       (10, 'Test 23'), (10, 'Test 24'),
+                                       (10, 'Test 25'), (10, 'Test 26'), (10, 'Test 27'),
+                                       (11, 'SD 6'),
+                                       (12, 'SD 7'), (12, 'SD 9'), (12, 'SD 10'),
+                                       (13, 'SD 11'),
+                                       (14, 'SD 13'), (14, 'SD 14'), (14, 'SD 15'),
+                                       (14, 'SD 16'), (14, 'SD 17'), (14, 'SD 18'),
+                                       (14, 'SD 19'), (14, 'SD 21'), (14, 'SD 22'),
+                                       (14, 'SD 23'), (14, 'SD 24'), (14, 'SD 25'),
+                                       (14, 'SD 26'), (14, 'SD 27'), (14, 'SD 28'), (14, 'SD 29'), (14, 'SD 30'),
+                                       (15, 'SD 31'), (15, 'SD 32'), (15, 'SD 33'),
+                                       (16, 'SD 36'), (16, 'SD 37'), (16, 'SD 38'),
+                                       (17, 'SD 39'),
+                                       (18, 'SD 42'),
+                                       (20, 'SD 47'), (20, 'SD 49'), (20, 'SD 50'),
+                                       (21, 'SD 52'),
+                                       (23, 'NP 2'), (23, 'NP 3'),
+                                       (24, 'NP 4'), (24, 'NP 5'), (24, 'NP 7'),
+                                       (26, 'NP 13'), (26, 'NP 14'), (26, 'NP 15'),
+                                       (27, 'NP 16'), (27, 'NP 18'), (27, 'NP 19'),
+                                       (28, 'NP 20'), (28, 'NP 21'), (28, 'NP 22'),
+                                       (29, 'NP 24'), (29, 'NP 25'), (29, 'NP 27'),
+                                       (29, 'NP 28'), (29, 'NP 29'), (29, 'NP 30'),
+                                       (29, 'NP 31')]}
+plot_defaults = {'x_axis_max': {6: 40, 11: 25, 13: 25, 17: 25, 18: 25, 19: 25, 14: 30, 16: 15},
+                 'y_axis_log': {14: [0.001, 100]},
+                 'rc': plot_rc}
+replica_lists, plot_style, output_root = dict(replica_defaults), dict(plot_defaults), 'regression'
+features_cache, correlation_cache = {}, {}
+time_columns = ['lag_corrosion_mm_yr', 'rolling_mean_corrosion_mm_yr', 'rolling_slope_corrosion_mm_yr',
+                'time_since_dose_hrs', 'cumulative_exposure_ppm_hrs']
 
 
 # ----------------------------------------------------------------------------------------------------------------------
@@ -86,6 +193,11 @@ def clean_data(df):
     df = df.drop(['corrosion_mm_yr', 'initial_corrosion_mm_yr'], axis=1)
     df['corrosion_mm_yr'], df['initial_corrosion_mm_yr'] = aux, aux2
     df = df.dropna(axis=0, how='any').reset_index(drop=True)
+    df = clean_categories(df)
+    return df
+
+
+def clean_categories(df):
     df['Lab'] = df['Lab'].str.rstrip()
     df['Type_of_test'] = df['Type_of_test'].str.rstrip()
     df = df.replace({'Type_of_test': {'Sequential Dose': 'sequential_dose',
@@ -95,29 +207,112 @@ def clean_data(df):
     return df
 
 
-def read_data(file_name, new):
+def data_profile(df, edges=None, bins=10):
+    # per-column sums, histograms (on the reference quantile edges) and category counts
+    # a sheet that cleaning emptied still gets a profile (zero counts, no range), so the report can flag it
+    _values = df[monitor_numeric].to_numpy(dtype='float64')
+    _valid = ~np.isnan(_values)
+    if edges is None and len(df) == 0:
+        edges = np.full((bins + 1, len(monitor_numeric)), np.nan)
+    elif edges is None:
+        edges = np.nanquantile(_values, np.linspace(0, 1, bins + 1), axis=0)
+    histograms = np.stack([np.bincount(np.searchsorted(edges[1:-1, j], _values[_valid[:, j], j], side='right'),
+                                       minlength=edges.shape[0] - 1) for j in range(len(monitor_numeric))], axis=1)
+    return {'rows': len(df), 'count': _valid.sum(axis=0), 'sum': np.nansum(_values, axis=0),
+            'sum2': np.nansum(_values ** 2, axis=0),
+            'min': np.min(np.where(_valid, _values, np.inf), axis=0, initial=np.inf),
+            'max': np.max(np.where(_valid, _values, -np.inf), axis=0, initial=-np.inf),
+            'edges': edges, 'histograms': histograms,
+            'levels': {column: np.unique(df[column].dropna().to_numpy(dtype='float64')) for column in monitor_levels},
+            'categories': {column: df[column].astype(str).value_counts() for column in monitor_categorical}}
+
+
+def drift_report(df_raw, profile, reference, sheet_name, psi=False):
+    _count = np.maximum(profile['count'], 1)
+    _mean = profile['sum'] / _count
+    _std = np.sqrt(np.maximum(profile['sum2'] / _count - _mean ** 2, 0))
+    report = pd.DataFrame({'sheet': sheet_name, 'column': monitor_numeric, 'rows_raw': len(df_raw),
+                           'rows_clean': profile['rows'],
+                           'missing': [df_raw[c].isna().sum() if c in df_raw else len(df_raw) for c in monitor_numeric],
+                           'negative': [(df_raw[c] < 0).sum() if c in df_raw else 0 for c in monitor_numeric],
+                           'mean': _mean, 'std': _std, 'min': profile['min'], 'max': profile['max'],
+                           'drift': profile['rows'] == 0})
+    if profile['rows'] == 0:
+        print('WARNING: {} - no rows left after cleaning'.format(sheet_name))
+    if reference is not None:
+        _ref_count = np.maximum(reference['count'], 1)
+        _ref_mean = reference['sum'] / _ref_count
+        _ref_std = np.sqrt(np.maximum(reference['sum2'] / _ref_count - _ref_mean ** 2, 0))
+        # population stability index between the new data and the training fingerprint histograms
+        _p = np.maximum(profile['histograms'] / np.maximum(profile['histograms'].sum(axis=0), 1), 1e-6)
+        _q = np.maximum(reference['histograms'] / np.maximum(reference['histograms'].sum(axis=0), 1), 1e-6)
+        report['ref_mean'], report['ref_std'] = _ref_mean, _ref_std
+        report['ref_min'], report['ref_max'] = reference['min'], reference['max']
+        report['out_of_range'] = (profile['min'] < reference['min']) | (profile['max'] > reference['max'])
+        levels = reference.get('levels', {})
+        report['unseen'] = [', '.join('{:g}'.format(v) for v in np.setdiff1d(profile['levels'][c], levels[c]))
+                            if c in levels else '' for c in monitor_numeric]
+        report['drift'] = report['drift'] | report['out_of_range'] | (report['unseen'] != '')
+        if psi:
+            report['psi'] = np.where(np.isin(monitor_numeric, monitor_varying),
+                                     ((_p - _q) * np.log(_p / _q)).sum(axis=0), np.nan)
+            report['drift'] = report['drift'] | (report['psi'] > 0.25)
+        unseen = {column: sorted(set(profile['categories'][column].index) -
+                                 set(reference['categories'][column].index)) for column in monitor_categorical}
+        report = pd.concat([report, pd.DataFrame({'sheet': sheet_name, 'column': monitor_categorical,
+                                                  'unseen': [', '.join(unseen[c]) for c in monitor_categorical],
+                                                  'drift': [len(unseen[c]) > 0 for c in monitor_categorical]})],
+                           ignore_index=True)
+        for column in report.loc[report['drift'], 'column']:
+            print('WARNING: {} - {} differs from the training data'.format(sheet_name, column))
+    return report
+
+
+def read_data(file_name, new, monitor=False, strict=False):
+    reference = None
+    if monitor and os.path.exists('{}Fingerprint.pkl'.format(file_name)):
+        with open('{}Fingerprint.pkl'.format(file_name), 'rb') as _file:
+            reference = pickle.load(_file)
     if new:
         sheet_names = pd.ExcelFile('{}.xlsx'.format(file_name)).sheet_names
-        df = pd.DataFrame()
+        raws, frames = [], []
         n = 0
         for sheet_name in sheet_names:
-            if sheet_name == sheet_names[0]:
-                df = pd.read_excel('{}.xlsx'.format(file_name), sheet_name=sheet_name)
-                df = read_exp(df, 'training')
-                df['Experiment'] = n + 1
-            else:
-                df2 = pd.read_excel('{}.xlsx'.format(file_name), sheet_name=sheet_name)
-                df2 = read_exp(df2, 'training')
-                df2['Experiment'] = n + 1
-                df = pd.concat([df, df2], ignore_index=True)
+            df2 = pd.read_excel('{}.xlsx'.format(file_name), sheet_name=sheet_name)
+            df2 = read_exp(df2, 'training')
+            df2['Experiment'] = n + 1
+            raws.append(df2)
+            frames.append(clean_data(df2.copy(deep=True)))
             n += 1
             print(n)
-        df = clean_data(df)
+        # a sheet missing a column only gets NaNs once the sheets are concatenated, so the rows are dropped here
+        df = pd.concat(frames, ignore_index=True).dropna(axis=0, how='any').reset_index(drop=True)
+        if monitor:
+            _edges = None if reference is None else reference['edges']
+            reports = [drift_report(raws[i], data_profile(df.loc[df['Experiment'] == i + 1], _edges), reference,
+                                    sheet_name) for i, sheet_name in enumerate(sheet_names)]
+            profile = data_profile(df, _edges)
+            reports.append(drift_report(pd.concat(raws, ignore_index=True), profile, reference, 'campaign', psi=True))
+            report = pd.concat(reports, ignore_index=True)
+            excel_output(report, _root='', file_name='{}Drift'.format(file_name), csv=False)
+            # categories the encoder has never seen would silently become all-zero columns for the cached model;
+            # monitored columns that are not encoded (Lab) only get the warning above
+            if reference is not None and strict:
+                unseen = report.loc[report['column'].isin(cat_index) & report['drift'] &
+                                    (report['sheet'] != 'campaign')]
+                if len(unseen) > 0:
+                    found = ['{} {} [{}]'.format(row['sheet'], row['column'], row['unseen'])
+                             for i, row in unseen.iterrows()]
+                    raise ValueError('unseen categories in {}: {}'.format(file_name, '; '.join(found)))
         excel_output(df, _root='', file_name='{}Cleaned'.format(file_name), csv=True)
     else:
         df = pd.read_csv('{}Cleaned.csv'.format(file_name))
         df = df.drop(['Unnamed: 0'], axis=1)
         n = len(df['Experiment'].unique())
+    # the data read here is what the model is trained on, so it becomes the reference of the next ingestion
+    if monitor and (new or reference is None):
+        with open('{}Fingerprint.pkl'.format(file_name), 'wb') as _file:
+            pickle.dump(data_profile(df), _file)
     return df, n
 
 
@@ -129,10 +324,7 @@ def filter_lab(df, lab):
 
 def remove_replicas(df):
     df2 = df.copy(deep=True)
-    _off_replicas = [(5, 'Test 5'), (5, 'Test 6'), (5, 'Test 7'), (5, 'Test 8'),  # Experiment 5 is out
-                     (19, 'SD 43'), (19, 'SD 44'), (19, 'SD 45'), (19, 'SD 46'),  # Experiment 19 is out
-                     (22, 'SD 53'), (22, 'SD 54'),  # Experiment 22 is out
-                     (25, 'NP 8'), (25, 'NP 9'), (25, 'NP 10'), (25, 'NP 11')]  # Experiment 25 is out
+    _off_replicas = replica_lists['off']
     for replica in _off_replicas:
         df2 = df2.loc[df2['Description'] != replica[1]]
     df2 = df2.reset_index(drop=True)
@@ -141,31 +333,7 @@ def remove_replicas(df):
 
 def representative_replica(df):
     df2 = df.copy(deep=True)
-    _off_replicas = [(6, 'Test 10'), (6, 'Test 11'),
-                     (7, 'Test 12'), (7, 'Test 14'),
-                     (8, 'Test 16'),
-                     (9, 'Test 18'),
-                     (10, 'Test 19'), (10, 'Test 20'), (10, 'Test 21'), (10, 'Test 23'), (10, 'Test 24'),
-                     (10, 'Test 25'), (10, 'Test 26'), (10, 'Test 27'),
-                     (11, 'SD 6'),
-                     (12, 'SD 7'), (12, 'SD 9'), (12, 'SD 10'),
-                     (13, 'SD 11'),
-                     (14, 'SD 13'), (14, 'SD 14'), (14, 'SD 15'), (14, 'SD 16'), (14, 'SD 17'), (14, 'SD 18'),
-                     (14, 'SD 19'), (14, 'SD 21'), (14, 'SD 22'), (14, 'SD 23'), (14, 'SD 24'), (14, 'SD 25'),
-                     (14, 'SD 26'), (14, 'SD 27'), (14, 'SD 28'), (14, 'SD 29'), (14, 'SD 30'),
-                     (15, 'SD 31'), (15, 'SD 32'), (15, 'SD 33'),
-                     (16, 'SD 36'), (16, 'SD 37'), (16, 'SD 38'),
-                     (17, 'SD 39'),
-                     (18, 'SD 42'),
-                     (20, 'SD 47'), (20, 'SD 49'), (20, 'SD 50'),
-                     (21, 'SD 52'),
-                     (23, 'NP 2'), (23, 'NP 3'),
-                     (24, 'NP 4'), (24, 'NP 5'), (24, 'NP 7'),
-                     (26, 'NP 13'), (26, 'NP 14'), (26, 'NP 15'),
-                     (27, 'NP 16'), (27, 'NP 18'), (27, 'NP 19'),
-                     (28, 'NP 20'), (28, 'NP 21'), (28, 'NP 22'),
-                     (29, 'NP 24'), (29, 'NP 25'), (29, 'NP 27'), (29, 'NP 28'), (29, 'NP 29'), (29, 'NP 30'),
-                     (29, 'NP 31')]
+    _off_replicas = replica_lists['representative']
     for replica in _off_replicas:
         df2 = df2.loc[df2['Description'] != replica[1]]
     df2 = df2.reset_index(drop=True)
@@ -250,25 +418,13 @@ def view_data_exp(df, y_axis_scale, _set, _root):
         if y_axis_scale == 'Log':
             plt.yscale('log')
             # ax.yaxis.set_major_formatter(FormatStrFormatter('%.2f'))
-            if _exp == 14:
-                ax.set_ylim(0.001, 100)
-                # ax.yaxis.set_major_formatter(FormatStrFormatter('%.3f'))
-            else:
-                ax.set_ylim(0.01, 100)
+            ax.set_ylim(*y_axis_limits(_exp))
         # ---------------------------------
         plt.text(0.02, 1.03, 'Experiment {}'.format(_exp),
                  ha='left', va='center', transform=ax.transAxes, fontdict={'color': 'k', 'weight': 'bold', 'size': 21})
         # ---------------------------------
         plt.grid(linewidth=0.5)
-        x_axis_max = 10 * (1 + int(np.max(_X_plot) / 10))
-        if _exp == 6:
-            x_axis_max = 40
-        elif _exp == 11 or _exp == 13 or _exp == 17 or _exp == 18 or _exp == 19:
-            x_axis_max = 25
-        elif _exp == 14:
-            x_axis_max = 30
-        elif _exp == 16:
-            x_axis_max = 15
+        x_axis_max = x_axis_limit(_X_plot, _exp)
         x_axis_index = np.linspace(0, x_axis_max, num=6)
         ax.set_xticks(x_axis_index)
         ax.set_xlim(0, x_axis_max)
@@ -286,6 +442,14 @@ def view_data_exp(df, y_axis_scale, _set, _root):
         plt.close()
 
 
+def x_axis_limit(_X, _exp):
+    return plot_style['x_axis_max'].get(_exp, 10 * (1 + int(np.max(_X) / 10)))
+
+
+def y_axis_limits(_exp):
+    return plot_style['y_axis_log'].get(_exp, [0.01, 100])
+
+
 def experiments_types(df, y_axis_scale, _experiments, _root):
     _root = '{}/experimentsTypes{}'.format(_root, y_axis_scale)
     if not os.path.exists(_root):
@@ -333,7 +497,7 @@ def experiments_types(df, y_axis_scale, _experiments, _root):
 
 
 def summary_data(df):
-    _root = 'regression/dataSummary'
+    _root = '{}/dataSummary'.format(output_root)
     if not os.path.exists(_root):
         os.makedirs(_root)
     # ---------------------------------
@@ -369,17 +533,73 @@ def excel_output(_object, _root, file_name, csv):
 
 
 # ----------------------------------------------------------------------------------------------------------------------
-def select_features(df):
-    df = df[['concentration_ppm', 'pre_concentration_zero', 'pre_concentration_ppm', 'time_hrs',
-             'Pressure_bar_CO2', 'Temperature_C', 'CI', 'Shear_Pa', 'Brine_Ionic_Strength',
-             'pH', 'Brine_Type', 'Type_of_test', 'initial_corrosion_mm_yr', 'Description', 'Experiment',
-             'corrosion_mm_yr']]
+def data_fingerprint(df):
+    _hash = hashlib.sha1(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    _hash.update(','.join([str(column) for column in df.columns]).encode())
+    return _hash.hexdigest()
+
+
+def group_rolling_sum(series, keys, window):
+    # trailing sum over the last `window` points of each group from grouped cumulative sums (NaN until complete)
+    windows = window if isinstance(window, (list, tuple)) else [window]
+    _sum = series.fillna(0).groupby(keys).cumsum()
+    _nan = series.isna().astype('int64').groupby(keys).cumsum()
+    _position = series.groupby(keys).cumcount()
+    sums = {}
+    for w in windows:
+        _sum_w = _sum - _sum.groupby(keys).shift(w).fillna(0)
+        _nan_w = _nan - _nan.groupby(keys).shift(w).fillna(0)
+        sums[w] = _sum_w.where((_position >= w - 1) & (_nan_w == 0))
+    if not isinstance(window, (list, tuple)):
+        return sums[window]
+    return sums
+
+
+def time_features(df, window):
+    key = (data_fingerprint(df), window)
+    if key in features_cache:
+        return features_cache[key].copy(deep=True)
+    # ---------------------------------
+    df2 = df.reset_index(drop=True)
+    df2 = df2.sort_values(['Experiment', 'Description', 'time_hrs_original'], kind='mergesort')
+    replica = [df2['Experiment'], df2['Description']]
+    segment = replica + [df2['concentration_ppm']]
+    _t, _y = df2['time_hrs_original'], df2['corrosion_mm_yr']
+    # rolling statistics only look at the previous `window` points, never at the current rate
+    _t_lag, _y_lag = _t.groupby(segment).shift(1), _y.groupby(segment).shift(1)
+    _st, _sy = group_rolling_sum(_t_lag, segment, window), group_rolling_sum(_y_lag, segment, window)
+    _stt, _sty = group_rolling_sum(_t_lag ** 2, segment, window), group_rolling_sum(_t_lag * _y_lag, segment, window)
+    _den = window * _stt - _st ** 2
+    df2['lag_corrosion_mm_yr'] = _y_lag
+    df2['rolling_mean_corrosion_mm_yr'] = _sy / window
+    df2['rolling_slope_corrosion_mm_yr'] = (window * _sty - _st * _sy) / _den.where(_den > 0)
+    # time_hrs already restarts at every concentration step; this counts from the first nonzero dose of the replica
+    _first_dose = _t.where(df2['concentration_ppm'] > 0).groupby(replica).transform('min')
+    df2['time_since_dose_hrs'] = (_t - _first_dose).clip(lower=0).fillna(0.0)
+    _dt = _t.groupby(replica).diff().fillna(0)
+    df2['cumulative_exposure_ppm_hrs'] = (df2['concentration_ppm'] * _dt).groupby(replica).cumsum()
+    # ---------------------------------
+    # no history at the start of a segment: fall back to the initial rate of the replica and a flat slope
+    if 'initial_corrosion_mm_yr' in df2.columns:
+        for column in ['lag_corrosion_mm_yr', 'rolling_mean_corrosion_mm_yr']:
+            df2[column] = df2[column].fillna(df2['initial_corrosion_mm_yr'])
+    df2['rolling_slope_corrosion_mm_yr'] = df2['rolling_slope_corrosion_mm_yr'].fillna(0.0)
+    df2 = df2.sort_index()
+    features_cache[key] = df2
+    return df2.copy(deep=True)
+
+
+def select_features(df, temporal=False):
+    columns = ['concentration_ppm', 'pre_concentration_zero', 'pre_concentration_ppm', 'time_hrs',
+               'Pressure_bar_CO2', 'Temperature_C', 'CI', 'Shear_Pa', 'Brine_Ionic_Strength',
+               'pH', 'Brine_Type', 'Type_of_test', 'initial_corrosion_mm_yr']
+    if temporal:
+        columns = columns + time_columns
+    df = df[columns + ['Description', 'Experiment', 'corrosion_mm_yr']]
     return df
 
 
 def encode_data(df):
-    cat_index = ['pre_concentration_zero', 'CI', 'pH', 'Brine_Type', 'Type_of_test']
-    num_index = ['Pressure_bar_CO2', 'Temperature_C', 'Shear_Pa', 'Brine_Ionic_Strength']
     ohe = OneHotEncoder(sparse=False, handle_unknown='ignore')
     sc = StandardScaler()
     ct = make_column_transformer((ohe, cat_index), (sc, num_index), remainder='passthrough')
@@ -393,22 +613,24 @@ def encode_data(df):
             names.append('{}_{}'.format(cat, name))
     for num in num_index:
         names.append(num)
-    names.append('concentration_ppm')
-    names.append('pre_concentration_ppm')
-    names.append('time_hrs')
-    names.append('initial_corrosion_mm_yr')
-    names.append('Description')
-    names.append('Experiment')
-    names.append('corrosion_mm_yr')
+    for column in df.columns:
+        if column not in cat_index and column not in num_index:
+            names.append(column)
     # ---------------------------------
     df2 = pd.DataFrame(df2)
     df2.columns = names
     return df2
 
 
-def split_data_random(df, test_size):
+def seed_streams(seed, n, name):
+    # independent child seeds per replica/fold, spawned from the root seed under a stream name
+    children = np.random.SeedSequence(seed, spawn_key=(zlib.crc32(name.encode()),)).spawn(n)
+    return [int(child.generate_state(1)[0]) for child in children]
+
+
+def split_data_random(df, test_size, random_state=None):
     df = df.copy(deep=True)
-    df = shuffle(df)
+    df = shuffle(df, random_state=random_state)
     head = int((1 - test_size) * len(df))
     tail = len(df) - head
     df_train = df.head(head).reset_index(drop=True)
@@ -416,32 +638,23 @@ def split_data_random(df, test_size):
     return df_train, df_test
 
 
-def split_xy(df, _shuffle):
+def split_xy(df, _shuffle, random_state=None):
     if _shuffle:
-        df = shuffle(df)
+        df = shuffle(df, random_state=random_state)
     df = df.drop(['Description', 'Experiment'], axis=1)
     _X = df.iloc[:, 0:-1].reset_index(drop=True)
     _y = df.iloc[:, -1].to_numpy()
     return _X, _y
 
 
-def grid_search(model):
+def grid_search(model, grid=None):
+    grid = grid_defaults if grid is None else grid
     models = []
-    hp1 = {'MLP': [(2,), (4,), (6,), (8,), (10,),
-                   (2, 2), (4, 4), (6, 6), (8, 8), (10, 10),
-                   (2, 2, 2), (4, 4, 4), (6, 6, 6), (8, 8, 8), (10, 10, 10),
-                   (2, 2, 2, 2), (4, 4, 4, 4), (6, 6, 6, 6), (8, 8, 8, 8), (10, 10, 10, 10),
-                   (2, 2, 2, 2, 2), (4, 4, 4, 4, 4), (6, 6, 6, 6, 6), (8, 8, 8, 8, 8), (10, 10, 10, 10, 10)],
-           'SVM': [1, 0.1, 0.01, 0.001, 0.0001],
-           'RF': [10, 50, 100, 200, 500],
-           'KNN': [1, 2, 3, 4, 5, 6, 7]}
-    hp2 = {'MLP': ['constant'],
-           'SVM': [1, 5, 10, 100, 1000],
-           'RF': [0.6, 0.7, 0.8, 0.9, 1.0],
-           'KNN': ['uniform', 'distance']}
+    hp1, hp2 = grid['hp1'], grid['hp2']
     for n in hp1[model]:
         for m in hp2[model]:
             if model == 'MLP':
+                n = tuple(n)
                 models.append(('MLP_{}_{}'.format(n, m), MLPRegressor(max_iter=10000, random_state=5,
                                                                       hidden_layer_sizes=n, learning_rate=m)))
             elif model == 'SVM':
@@ -454,24 +667,148 @@ def grid_search(model):
     return models
 
 
+def build_models(models):
+    estimators = {'MLP': MLPRegressor, 'SVM': SVR, 'RF': RandomForestRegressor, 'KNN': KNeighborsRegressor}
+    return [(name, estimators[name](**{key: tuple(value) if isinstance(value, list) else value
+                                       for key, value in models[name].items()})) for name in models]
+
+
+def compare_replica(df, models, cv, scoring, seed):
+    _X_train, _y_train = split_xy(df, True, random_state=seed)
+    temp = []
+    for name, model in models:
+        print(name)
+        cv_results = cross_val_score(clone(model), _X_train, _y_train, cv=cv, scoring=scoring)
+        cv_results = np.mean(cv_results)
+        temp.append(cv_results)
+    return temp
+
+
+def fit_score(model, _X, _y, train_index, test_index, scoring, blas_threads):
+    with threadpool_limits(limits=blas_threads):
+        model.fit(_X[train_index], _y[train_index])
+        return get_scorer(scoring)(model, _X[test_index], _y[test_index])
+
+
+def pool_scores(df, models, cv, scoring, seeds, _param):
+    # every (replica, model, fold) fit is one task of a process pool with capped BLAS threads per worker
+    n_workers = _param['n_jobs']
+    if n_workers == -1:
+        n_workers = max(1, (os.cpu_count() or 1) // _param['blas_threads'])
+    if _param['mlp_early_stopping']:
+        models = [(name, clone(model).set_params(early_stopping=True, n_iter_no_change=_param['mlp_patience']))
+                  for name, model in models]
+    tasks = []
+    for i, seed in enumerate(seeds):
+        _X_train, _y_train = split_xy(df, True, random_state=seed)
+        # plain float arrays, converted once per replica, are memory-mapped by joblib instead of pickled per task
+        _X_train, _y_train = _X_train.to_numpy(dtype='float64'), np.asarray(_y_train, dtype='float64')
+        for f, (train_index, test_index) in enumerate(KFold(n_splits=cv).split(_X_train)):
+            for m in range(len(models)):
+                tasks.append((i, m, f, _X_train, _y_train, train_index, test_index))
+    scores = Parallel(n_jobs=n_workers, backend='loky')(
+        delayed(fit_score)(clone(models[m][1]), _X, _y, train_index, test_index, scoring, _param['blas_threads'])
+        for i, m, f, _X, _y, train_index, test_index in tasks)
+    temp = np.zeros((len(seeds), len(models), cv))
+    for (i, m, f, _X, _y, train_index, test_index), score in zip(tasks, scores):
+        temp[i, m, f] = score
+    return [list(temp[i].mean(axis=1)) for i in range(len(seeds))]
+
+
+def prediction_score(scoring, _y, _pred):
+    if scoring == 'r2':
+        return r2_score(_y, _pred)
+    return -mean_squared_error(_y, _pred)
+
+
+def shared_knn(models):
+    # KNN candidates that differ only in k and weighting can share one neighbor search
+    keys = {(model.algorithm, model.leaf_size, model.metric, model.p, str(model.metric_params))
+            for name, model in models if isinstance(model, KNeighborsRegressor)}
+    return (len(keys) == 1 and all(isinstance(model, KNeighborsRegressor) and model.weights in ('uniform', 'distance')
+                                   for name, model in models))
+
+
+def knn_replica(df, models, cv, scoring, seed):
+    # one index per training fold queried once for the largest k; every k/weighting variant reuses the result
+    _X_train, _y_train = split_xy(df, True, random_state=seed)
+    _X_train, _y_train = _X_train.to_numpy(dtype='float64'), np.asarray(_y_train, dtype='float64')
+    base, k_max = models[0][1], max(model.n_neighbors for name, model in models)
+    temp = np.zeros((len(models), cv))
+    for f, (train_index, test_index) in enumerate(KFold(n_splits=cv).split(_X_train)):
+        index = NearestNeighbors(n_neighbors=k_max, algorithm=base.algorithm, leaf_size=base.leaf_size,
+                                 metric=base.metric, p=base.p, metric_params=base.metric_params)
+        index.fit(_X_train[train_index])
+        dist, ind = index.kneighbors(_X_train[test_index])
+        _y_neighbors = _y_train[train_index][ind]
+        for m, (name, model) in enumerate(models):
+            _dist, _y_k = dist[:, :model.n_neighbors], _y_neighbors[:, :model.n_neighbors]
+            if model.weights == 'uniform':
+                _pred = _y_k.mean(axis=1)
+            else:
+                # same rule as sklearn: a query with exact matches only averages over those matches
+                with np.errstate(divide='ignore'):
+                    weights = 1.0 / _dist
+                exact = (_dist == 0).any(axis=1)
+                weights[exact] = (_dist[exact] == 0).astype('float64')
+                _pred = (weights * _y_k).sum(axis=1) / weights.sum(axis=1)
+            temp[m, f] = prediction_score(scoring, _y_train[test_index], _pred)
+    return list(temp.mean(axis=1))
+
+
+def svm_gamma(gamma, _X):
+    if gamma == 'scale':
+        return 1.0 / (_X.shape[1] * _X.var()) if _X.var() != 0 else 1.0
+    if gamma == 'auto':
+        return 1.0 / _X.shape[1]
+    return float(gamma)
+
+
+def svm_replica(df, models, cv, scoring, seed, cache_mb):
+    # each fold builds the rbf kernel once per gamma and fits every C on it; least recently used kernels are
+    # evicted once the cache goes over cache_mb
+    _X_train, _y_train = split_xy(df, True, random_state=seed)
+    _X_train, _y_train = _X_train.to_numpy(dtype='float64'), np.asarray(_y_train)
+    temp = np.zeros((len(models), cv))
+    for f, (train_index, test_index) in enumerate(KFold(n_splits=cv).split(_X_train)):
+        _X_fit, _X_val = _X_train[train_index], _X_train[test_index]
+        kernels, size = OrderedDict(), 0
+        for m, (name, model) in enumerate(models):
+            gamma = svm_gamma(model.gamma, _X_fit)
+            if gamma in kernels:
+                kernels.move_to_end(gamma)
+                _K_fit, _K_val = kernels[gamma]
+            else:
+                _K_fit, _K_val = rbf_kernel(_X_fit, gamma=gamma), rbf_kernel(_X_val, _X_fit, gamma=gamma)
+                kernels[gamma] = _K_fit, _K_val
+                size += _K_fit.nbytes + _K_val.nbytes
+                while size > cache_mb * 2 ** 20 and len(kernels) > 1:
+                    _old = kernels.popitem(last=False)[1]
+                    size -= _old[0].nbytes + _old[1].nbytes
+            svm = clone(model).set_params(kernel='precomputed').fit(_K_fit, _y_train[train_index])
+            temp[m, f] = get_scorer(scoring)(svm, _K_val, _y_train[test_index])
+    return list(temp.mean(axis=1))
+
+
 def compare_models(df, models, _param):
     scoring, cv, replicas = 'neg_mean_squared_error', _param['cv'], _param['replicas']
     if _param['scoring'] == 'r2':
         scoring = 'r2'
     # ---------------------------------
-    results = pd.DataFrame()
-    for i in range(replicas):
-        _X_train, _y_train = split_xy(df, True)
-        temp = []
-        for name, model in models:
-            print(name)
-            cv_results = cross_val_score(model, _X_train, _y_train, cv=cv, scoring=scoring)
-            cv_results = np.mean(cv_results)
-            temp.append(cv_results)
-        if i == 0:
-            results = pd.DataFrame(temp)
-        else:
-            results = pd.concat([results, pd.DataFrame(temp)], axis=1, ignore_index=True)
+    seeds = seed_streams(_param['seed'], replicas, 'compare_models')
+    if _param['mlp_pool'] and all(isinstance(model, MLPRegressor) for name, model in models):
+        temp = pool_scores(df, models, cv, scoring, seeds, _param)
+    elif _param['knn_index'] and shared_knn(models):
+        temp = Parallel(n_jobs=_param['n_jobs'])(delayed(knn_replica)(df, models, cv, scoring, seed)
+                                                 for seed in seeds)
+    elif _param['svm_kernel_cache'] and all(isinstance(model, SVR) and model.kernel == 'rbf' for name, model in models):
+        temp = Parallel(n_jobs=_param['n_jobs'])(delayed(svm_replica)(df, models, cv, scoring, seed,
+                                                                      _param['kernel_cache_mb'])
+                                                 for seed in seeds)
+    else:
+        temp = Parallel(n_jobs=_param['n_jobs'])(delayed(compare_replica)(df, models, cv, scoring, seed)
+                                                 for seed in seeds)
+    results = pd.DataFrame(np.column_stack(temp))
     results['mean'] = results.mean(axis=1)
     results['std'] = results.std(axis=1)
     # ---------------------------------
@@ -487,19 +824,63 @@ def compare_models(df, models, _param):
     return results, _best
 
 
+def fit_member(model, _X, _y, train_index, test_index):
+    if train_index is None:
+        return model.fit(_X, _y), None
+    model.fit(_X.iloc[train_index], _y[train_index])
+    return model, model.predict(_X.iloc[test_index])
+
+
+class EnsembleRegressor(BaseEstimator, RegressorMixin):
+    # stacking (positive linear meta-learner on out-of-fold predictions) or plain averaging of the base models
+
+    def __init__(self, models, mode='stacking', cv=5, n_jobs=-1):
+        self.models = models
+        self.mode = mode
+        self.cv = cv
+        self.n_jobs = n_jobs
+
+    def fit(self, _X, _y):
+        _X, _y = pd.DataFrame(_X).reset_index(drop=True), np.asarray(_y)
+        folds = list(KFold(n_splits=self.cv).split(_X)) if self.mode == 'stacking' else []
+        jobs = [(m, None, None) for m in range(len(self.models))]
+        jobs += [(m, train, test) for m in range(len(self.models)) for train, test in folds]
+        # base models and all their fold fits share one pool, so the wall time follows the slowest model
+        fitted = Parallel(n_jobs=self.n_jobs)(delayed(fit_member)(clone(self.models[m][1]), _X, _y, train, test)
+                                              for m, train, test in jobs)
+        self.base_estimators_ = [fitted[m][0] for m in range(len(self.models))]
+        if self.mode == 'stacking':
+            _oof = np.zeros((len(_y), len(self.models)))
+            for (m, train, test), (model, _y_pred) in zip(jobs[len(self.models):], fitted[len(self.models):]):
+                _oof[test, m] = _y_pred
+            self.meta_ = LinearRegression(positive=True).fit(_oof, _y)
+        return self
+
+    def predict(self, _X):
+        _y_base = np.column_stack([model.predict(_X) for model in self.base_estimators_])
+        if self.mode == 'stacking':
+            return self.meta_.predict(_y_base)
+        return _y_base.mean(axis=1)
+
+
+def prediction_replica(df, estimator, test_size, seed):
+    # one RandomState per replica, consumed in the same order whether replicas run serially or in parallel
+    random_state = np.random.RandomState(seed)
+    df_training, df_testing = split_data_random(df, test_size, random_state)
+    _X_train, _y_train = split_xy(df_training, True, random_state)
+    _estimator = clone(estimator).fit(_X_train, _y_train)
+    _X_test, _y_test = split_xy(df_testing, True, random_state)
+    _y_pred = _estimator.predict(_X_test)
+    return {'r2': r2_score(_y_test, _y_pred), 'mse': mean_squared_error(_y_test, _y_pred),
+            'mae': mean_absolute_error(_y_test, _y_pred), 'rmse': np.sqrt(mean_squared_error(_y_test, _y_pred))}
+
+
 def prediction(df, estimator, _param):
     test_size, replicas = _param['test_size'], _param['replicas']
-    errors = pd.DataFrame()
-    for i in range(replicas):
-        df_training, df_testing = split_data_random(df, test_size)
-        _X_train, _y_train = split_xy(df_training, True)
-        estimator.fit(_X_train, _y_train)
-        _X_test, _y_test = split_xy(df_testing, True)
-        _y_pred = estimator.predict(_X_test)
-        errors.loc[i, 'r2'] = r2_score(_y_test, _y_pred)
-        errors.loc[i, 'mse'] = mean_squared_error(_y_test, _y_pred)
-        errors.loc[i, 'mae'] = mean_absolute_error(_y_test, _y_pred)
-        errors.loc[i, 'rmse'] = np.sqrt(mean_squared_error(_y_test, _y_pred))
+    seeds = seed_streams(_param['seed'], replicas, 'prediction')
+    errors = Parallel(n_jobs=_param['n_jobs'])(delayed(prediction_replica)(df, estimator, test_size, seed)
+                                               for seed in seeds)
+    errors = pd.DataFrame(errors)
     _scores = [('R2', np.mean(errors['r2']), np.std(errors['r2'])),
                ('MSE', np.mean(errors['mse']), np.std(errors['mse'])),
                ('MAE', np.mean(errors['mae']), np.std(errors['mae'])),
@@ -537,17 +918,337 @@ def sensitivity(df_original, df, _experiment):
     return df, time_hrs_sens
 
 
-# ----------------------------------------------------------------------------------------------------------------------
-def smooth(y_array, window):
-    if window != 0:
-        y_smoothed = pd.Series(y_array).rolling(window, center=False).mean().shift(-window).to_numpy()
+def fit_cached(estimator, _X, _y, model_cache):
+    if model_cache is None:
+        return clone(estimator).fit(_X, _y)
+    key = (data_fingerprint(_X), hashlib.sha1(np.ascontiguousarray(_y).tobytes()).hexdigest(),
+           type(estimator).__name__, repr(estimator.get_params()))
+    if key not in model_cache:
+        model_cache[key] = clone(estimator).fit(_X, _y)
+    return model_cache[key]
+
+
+def validation_batch(df, df_all, df_selected, estimator, seat_outs, folder_name, _off_replicas, _param,
+                     model_cache=None):
+    fits = {}
+    for _seat_out in seat_outs:
+        fits.setdefault(tuple(sorted(int(i) for i in _seat_out)), []).append([int(i) for i in _seat_out])
+    experiments = sorted(set(_exp for key in fits for _exp in key))
+    plot_data = production_plot_data(df_all, df_selected, experiments, folder_name, _off_replicas)
+    # ---------------------------------
+    predictions, tasks = {}, {}
+    for key in fits:
+        # the seed follows the seat-out set itself, so the same training set is shuffled (and cached) identically
+        # whatever list or spec it comes from
+        seed = seed_streams(_param['seed'], 1, 'validation_batch_{}'.format(key))[0]
+        training, testing = split_data_exp(df, key)
+        _X_train, _y_train = split_xy(training, True, seed)
+        _estimator = fit_cached(estimator, _X_train, _y_train, model_cache)
+        _X_prod = []
+        for _exp in key:
+            testing_temp = testing.loc[testing['Experiment'] == _exp].reset_index(drop=True)
+            _X_test, _y_test = split_xy(testing_temp, False)
+            _X_exp, _y_exp = production(_X_test, _y_test)
+            _X_prod.append(_X_exp)
+        _bounds = np.cumsum([0] + [len(_X_exp) for _X_exp in _X_prod])
+        _X_prod = pd.concat(_X_prod, ignore_index=True)
+        _y_pred, _y_band = interval_prediction(_estimator, _X_prod, _param, _X_train, _y_train)
+        # ---------------------------------
+        for _seat_out in fits[key]:
+            predictions[tuple(_seat_out)] = {}
+            for j, _exp in enumerate(key):
+                _y_exp = _y_pred[_bounds[j]:_bounds[j + 1]]
+                _band_exp = None if _y_band is None else _y_band[:, _bounds[j]:_bounds[j + 1]]
+                predictions[tuple(_seat_out)][_exp] = _y_exp
+                for y_axis_scale in ['Log', 'Normal']:
+                    tasks[(tuple(_seat_out), _exp, y_axis_scale)] = \
+                        (None, None, _y_exp, folder_name, y_axis_scale, _exp, _seat_out, _band_exp, plot_data[_exp])
+    Parallel(n_jobs=_param['n_jobs'])(delayed(render_plot)(production_plot, task) for task in tasks.values())
+    return predictions
+
+
+def scenario_chunks(df_base, grid, df_stats, chunk_size, time_hrs=None):
+    # full-factorial sweep of `grid` (raw feature values) over the encoded base rows, streamed in chunks;
+    # every output row carries its experiment and measured time so the results can be put back on a time axis
+    _X_base = df_base.drop(['Description', 'Experiment', 'corrosion_mm_yr'], axis=1).reset_index(drop=True)
+    _n = len(_X_base)
+    _experiment = df_base['Experiment'].to_numpy(dtype='int64')
+    _time = np.full(_n, np.nan) if time_hrs is None else np.asarray(time_hrs, dtype='float64')
+    keys = [key for key in grid]
+    # one dtype per grid column for the whole sweep, so every chunk writes the same schema
+    dtypes = {key: 'float64' if all(isinstance(value, (int, float)) for value in grid[key]) else 'str'
+              for key in keys}
+    combinations = itertools.product(*[grid[key] for key in keys])
+    while True:
+        batch = list(itertools.islice(combinations, max(1, chunk_size // _n)))
+        if not batch:
+            return
+        _rows = np.repeat(np.arange(len(batch)), _n)
+        meta = pd.DataFrame(batch, columns=keys).astype(dtypes).iloc[_rows].reset_index(drop=True)
+        meta.insert(0, 'row', np.tile(np.arange(_n), len(batch)))
+        meta.insert(1, 'Experiment', np.tile(_experiment, len(batch)))
+        meta.insert(2, 'time_hrs_original', np.tile(_time, len(batch)))
+        _X = pd.DataFrame(np.tile(_X_base.to_numpy(dtype='float64'), (len(batch), 1)), columns=_X_base.columns)
+        for k, key in enumerate(keys):
+            if key in cat_index:
+                _labels = np.asarray(['{}_{}'.format(key, combination[k]) for combination in batch])[_rows]
+                for column in [c for c in _X.columns if c.startswith('{}_'.format(key))]:
+                    _X[column] = (_labels == column).astype('float64')
+            elif key in num_index:
+                key_mean, key_std = np.mean(df_stats[key]), np.std(df_stats[key])
+                _X[key] = (meta[key].to_numpy(dtype='float64') - key_mean) / float(key_std)
+            elif key == 'concentration_ppm':
+                _X[key] = np.where(_X[key] != 0, meta[key].to_numpy(dtype='float64'), 0.0)
+            else:
+                _X[key] = meta[key].to_numpy(dtype='float64')
+        yield meta, _X
+
+
+def predict_chunked(estimator, chunks, _root, file_name, _param):
+    if not os.path.exists(_root):
+        os.makedirs(_root)
+    _path = '{}/{}.{}'.format(_root, file_name, 'csv' if pq is None else 'parquet')
+    if os.path.exists(_path):
+        os.remove(_path)
+    # ---------------------------------
+    writer, rows, chunks = None, 0, iter(chunks)
+    for first in chunks:
+        # the memory ceiling decides how many chunks are materialized and predicted concurrently
+        _bytes = first[1].memory_usage(index=False).sum() + first[0].memory_usage(deep=True).sum()
+        n_batch = max(1, int(_param['max_memory_mb'] * 2 ** 20 // (_bytes + 8 * len(first[1]))))
+        batch = [first] + list(itertools.islice(chunks, n_batch - 1))
+        _y = Parallel(n_jobs=_param['n_jobs'], backend='threading')(
+            delayed(estimator.predict)(_X) for meta, _X in batch)
+        for (meta, _X), _y_chunk in zip(batch, _y):
+            output = meta.copy()
+            output['corrosion_mm_yr'] = _y_chunk
+            if pq is not None:
+                table = pa.Table.from_pandas(output, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(_path, table.schema)
+                writer.write_table(table)
+            else:
+                output.to_csv(_path, mode='a', header=(rows == 0), index=False)
+            rows += len(output)
+    if writer is not None:
+        writer.close()
+    return _path, rows
+
+
+def forest_intervals(estimator, _X, quantiles, chunk_size, _X_train=None, _y_train=None, max_memory_mb=1024):
+    # per-tree spread of the fitted forest; with training data, quantile-forest weights from shared leaves instead
+    # (those only shape the bands, the point is always the forest's own prediction)
+    if not isinstance(estimator, RandomForestRegressor):
+        raise TypeError('forest intervals need a RandomForestRegressor, got {}'.format(type(estimator).__name__))
+    quantiles = np.asarray(quantiles)
+    if _y_train is not None:
+        _leaves_train = estimator.apply(_X_train)
+        # the encoded frame is object dtype, so the target is cast before it is sorted and weighted
+        _y_train = np.asarray(_y_train, dtype='float64')
+        _order = np.argsort(_y_train)
+        _y_sorted = _y_train[_order]
+        # about five (chunk x n_train) float64 work matrices are alive per chunk
+        chunk_size = max(1, min(chunk_size, int(max_memory_mb * 2 ** 20 // (40 * len(_y_sorted)))))
+    _mean, _bands = [], []
+    for start in range(0, len(_X), chunk_size):
+        _X_chunk = _X.iloc[start:start + chunk_size] if hasattr(_X, 'iloc') else _X[start:start + chunk_size]
+        if _y_train is None:
+            _X_values = np.asarray(_X_chunk, dtype='float32')
+            _y_trees = np.stack([tree.predict(_X_values) for tree in estimator.estimators_])
+            _mean.append(_y_trees.mean(axis=0))
+            _bands.append(np.quantile(_y_trees, quantiles, axis=0))
+        else:
+            _leaves = estimator.apply(_X_chunk)
+            _weights = np.zeros((len(_leaves), len(_y_sorted)))
+            for t in range(_leaves.shape[1]):
+                _same = _leaves[:, t][:, None] == _leaves_train[:, t][None, :]
+                _weights += _same / np.maximum(_same.sum(axis=1, keepdims=True), 1)
+            _weights = _weights[:, _order] / _leaves.shape[1]
+            _cumulative = np.cumsum(_weights, axis=1)
+            _mean.append(estimator.predict(_X_chunk))
+            _bands.append(np.stack([_y_sorted[np.minimum((_cumulative < q).sum(axis=1), len(_y_sorted) - 1)]
+                                    for q in quantiles]))
+    return np.concatenate(_mean), np.concatenate(_bands, axis=1)
+
+
+def interval_prediction(estimator, _X, _param, _X_train=None, _y_train=None):
+    # bands only exist for forests; every other model falls back to its point prediction
+    if not _param['intervals'] or not isinstance(estimator, RandomForestRegressor):
+        return estimator.predict(_X), None
+    if _param['quantile_forest']:
+        return forest_intervals(estimator, _X, _param['quantiles'], _param['chunk_size'], _X_train, _y_train,
+                                _param['max_memory_mb'])
+    return forest_intervals(estimator, _X, _param['quantiles'], _param['chunk_size'])
+
+
+def export_forest(estimator, max_depth=None):
+    # flat node arrays of all trees (children as global indices, -1 for leaves), optionally cut at `max_depth`
+    trees = [tree.tree_ for tree in getattr(estimator, 'estimators_', [estimator])]
+    _sizes = np.asarray([tree.node_count for tree in trees])
+    _offsets = np.concatenate([[0], np.cumsum(_sizes)[:-1]])
+    _left = np.concatenate([np.where(t.children_left >= 0, t.children_left + o, -1)
+                            for t, o in zip(trees, _offsets)])
+    _right = np.concatenate([np.where(t.children_right >= 0, t.children_right + o, -1)
+                             for t, o in zip(trees, _offsets)])
+    arrays = {'roots': _offsets,
+              'feature': np.concatenate([t.feature for t in trees]),
+              'threshold': np.concatenate([t.threshold for t in trees]),
+              'value': np.concatenate([t.value[:, 0, 0] for t in trees]),
+              'left': _left, 'right': _right}
+    if max_depth is not None:
+        _depth, _nodes, d = np.zeros(len(_left), dtype='int64'), _offsets, 0
+        while len(_nodes) > 0:
+            _depth[_nodes] = d
+            _nodes = np.concatenate([_left[_nodes], _right[_nodes]])
+            _nodes, d = _nodes[_nodes >= 0], d + 1
+        _keep = _depth <= max_depth
+        _index = np.cumsum(_keep) - 1
+        _leaf = (_depth == max_depth) | (_left < 0)
+        arrays['left'] = np.where(_leaf, -1, _index[_left])[_keep]
+        arrays['right'] = np.where(_leaf, -1, _index[_right])[_keep]
+        arrays['roots'] = _index[_offsets]
+        for name in ['feature', 'threshold', 'value']:
+            arrays[name] = arrays[name][_keep]
+    for name in ['roots', 'feature', 'left', 'right']:
+        arrays[name] = arrays[name].astype('int32')
+    return arrays
+
+
+def save_forest(arrays, _root):
+    if not os.path.exists(_root):
+        os.makedirs(_root)
+    for name in arrays:
+        np.save('{}/{}.npy'.format(_root, name), arrays[name])
+
+
+def load_forest(_root):
+    return {name: np.load('{}/{}.npy'.format(_root, name), mmap_mode='r')
+            for name in ['roots', 'feature', 'threshold', 'value', 'left', 'right']}
+
+
+def compact_predict(arrays, _X):
+    # walks every tree for every row at once, one tree level per iteration
+    _X = np.asarray(_X, dtype='float32')
+    _rows = np.arange(len(_X))[:, None]
+    _nodes = np.tile(np.asarray(arrays['roots']), (len(_X), 1))
+    while True:
+        _left = arrays['left'][_nodes]
+        _split = _left >= 0
+        if not _split.any():
+            break
+        _go_left = _X[_rows, np.maximum(arrays['feature'][_nodes], 0)] <= arrays['threshold'][_nodes]
+        _nodes = np.where(_split, np.where(_go_left, _left, arrays['right'][_nodes]), _nodes)
+    return np.asarray(arrays['value'])[_nodes].mean(axis=1)
+
+
+def compaction_entry(name, model, _X_test, _y_test, repeats=50):
+    if isinstance(model, dict):
+        size = int(sum(model[array].nbytes for array in model))
+        predict = lambda _x: compact_predict(model, _x)
     else:
-        y_smoothed = y_array
+        size = len(pickle.dumps(model))
+        predict = model.predict
+    _row = _X_test.iloc[:1]
+    start = time.perf_counter()
+    for i in range(repeats):
+        predict(_row)
+    latency = 1000 * (time.perf_counter() - start) / repeats
+    return {'model': name, 'size_bytes': size, 'latency_ms': latency,
+            'mse': mean_squared_error(_y_test, predict(_X_test))}
+
+
+def compact_forest(df, estimator, _seat_out, _param):
+    if not isinstance(estimator, RandomForestRegressor):
+        print('compaction skipped: {} is not a random forest'.format(type(estimator).__name__))
+        return None
+    _root = '{}/modelCompaction'.format(output_root)
+    if not os.path.exists(_root):
+        os.makedirs(_root)
+    # ---------------------------------
+    training, testing = split_data_exp(df, _seat_out)
+    _X_train, _y_train = split_xy(training, True, seed_streams(_param['seed'], 1, 'compaction')[0])
+    _X_test, _y_test = split_xy(testing, False)
+    forest = clone(estimator).fit(_X_train, _y_train)
+    report = [compaction_entry('original', forest, _X_test, _y_test)]
+    candidates = {}
+    for n_trees in sorted(set(n for n in [10, 25, 50, 100, 200, forest.n_estimators] if n <= forest.n_estimators)):
+        pruned = clone(forest)
+        pruned.estimators_, pruned.n_estimators = forest.estimators_[:n_trees], n_trees
+        for max_depth in [6, 8, 10, 12, 16, None]:
+            name = 'compact_{}trees_depth{}'.format(n_trees, max_depth)
+            candidates[name] = export_forest(pruned, max_depth)
+            report.append(compaction_entry(name, candidates[name], _X_test, _y_test))
+    _y_forest = forest.predict(_X_train)
+    for max_depth in [6, 8, 10, 12, 16]:
+        # a distilled tree exports to the same flat arrays, so it competes with the pruned forests for deployment
+        name = 'distilled_tree_depth{}'.format(max_depth)
+        distilled = DecisionTreeRegressor(max_depth=max_depth, random_state=5).fit(_X_train, _y_forest)
+        candidates[name] = export_forest(distilled)
+        report.append(compaction_entry(name, candidates[name], _X_test, _y_test))
+    report = pd.DataFrame(report)
+    report['size_ratio'] = report['size_bytes'] / report.loc[0, 'size_bytes']
+    report['latency_ratio'] = report['latency_ms'] / report.loc[0, 'latency_ms']
+    report['within_tolerance'] = report['mse'] <= (1 + _param['compaction_tolerance']) * report.loc[0, 'mse']
+    excel_output(report, _root, file_name='compaction', csv=False)
+    # ---------------------------------
+    selected = report.loc[report['within_tolerance'] & report['model'].isin(candidates.keys())]
+    if len(selected) > 0:
+        name = selected.sort_values('size_bytes')['model'].iloc[0]
+        save_forest(candidates[name], '{}/{}'.format(_root, name))
+    return report
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def smooth(y_array, window, column='corrosion_mm_yr', by=('Experiment', 'Description')):
+    # mean of the `window` points following each sample; accepts one curve, a 2-D stack of curves (one per row)
+    # or a long-format frame grouped by `by`, and one window or a list of windows sharing the same cumulative sums
+    windows = window if isinstance(window, (list, tuple)) else [window]
+    y_smoothed = {}
+    if isinstance(y_array, pd.DataFrame):
+        keys = [y_array[key] for key in by]
+        sums = group_rolling_sum(y_array[column], keys, [w for w in windows if w != 0])
+        for w in windows:
+            if w != 0:
+                y_smoothed[w] = sums[w].groupby(keys).shift(-w) / w
+            else:
+                y_smoothed[w] = y_array[column]
+        y_smoothed = pd.DataFrame({'{}_smooth{}'.format(column, w): y_smoothed[w] for w in windows})
+        if not isinstance(window, (list, tuple)):
+            return y_smoothed.iloc[:, 0]
+        return y_smoothed
+    # ---------------------------------
+    _y = np.asarray(y_array, dtype='float64')
+    _curves = np.atleast_2d(_y)
+    _length = _curves.shape[1]
+    _valid = ~np.isnan(_curves)
+    _sum = np.zeros((_curves.shape[0], _length + 1))
+    _nan = np.zeros((_curves.shape[0], _length + 1))
+    _sum[:, 1:] = np.cumsum(np.where(_valid, _curves, 0.0), axis=1)
+    _nan[:, 1:] = np.cumsum(~_valid, axis=1)
+    for w in windows:
+        if w == 0:
+            y_smoothed[w] = y_array
+            continue
+        _mean = np.full(_curves.shape, np.nan)
+        if w < _length:
+            _mean_w = (_sum[:, w + 1:] - _sum[:, 1:_length - w + 1]) / w
+            _nan_w = _nan[:, w + 1:] - _nan[:, 1:_length - w + 1]
+            _mean[:, :_length - w] = np.where(_nan_w == 0, _mean_w, np.nan)
+        y_smoothed[w] = _mean.reshape(_y.shape)
+    if not isinstance(window, (list, tuple)):
+        return y_smoothed[window]
     return y_smoothed
 
 
+def render_plot(function, args):
+    # plots may be drawn in worker processes, which need the same backend and styling as the main one
+    matplotlib.use('Agg')
+    matplotlib.rcParams.update(plot_style['rc'])
+    function(*args)
+
+
 def compare_models_plot(df):
-    _root = 'regression/gridSearchModels'
+    _root = '{}/gridSearchModels'.format(output_root)
     if not os.path.exists(_root):
         os.makedirs(_root)
     # ---------------------------------
@@ -582,7 +1283,7 @@ def compare_models_plot(df):
 
 
 def compare_models_box_plot(df, _param):
-    _root = 'regression/gridSearchModels'
+    _root = '{}/gridSearchModels'.format(output_root)
     if not os.path.exists(_root):
         os.makedirs(_root)
     # ---------------------------------
@@ -616,12 +1317,49 @@ def compare_models_box_plot(df, _param):
     plt.close()
 
 
-def correlation_plot(df):
-    _root = 'regression/bestModelPerformance'
+def correlation_matrix(df, method='pearson', chunk_size=100000):
+    # encode_data returns object columns (Description is passed through), so every column is converted to float;
+    # text columns that do not convert are left out, rows with missing values are dropped, spearman correlates ranks
+    numeric = df.drop(['Description'], axis=1, errors='ignore').apply(pd.to_numeric, errors='coerce')
+    numeric = numeric.dropna(axis=1, how='all').dropna(axis=0, how='any').astype('float64')
+    if numeric.shape[1] == 0 or len(numeric) == 0:
+        raise ValueError('no numeric columns (or complete rows) left to correlate')
+    key = (data_fingerprint(numeric), method)
+    if key in correlation_cache:
+        return correlation_cache[key][0].copy(), correlation_cache[key][1].copy()
+    _values = numeric.to_numpy(dtype='float64')
+    if method == 'spearman':
+        _values = numeric.rank().to_numpy(dtype='float64')
+    # ---------------------------------
+    _n, _sum = len(_values), np.zeros(_values.shape[1])
+    _min, _max = np.full(_values.shape[1], np.inf), np.full(_values.shape[1], -np.inf)
+    for start in range(0, _n, chunk_size):
+        _chunk = _values[start:start + chunk_size]
+        _sum += _chunk.sum(axis=0)
+        _min, _max = np.minimum(_min, _chunk.min(axis=0)), np.maximum(_max, _chunk.max(axis=0))
+    _mean = _sum / max(_n, 1)
+    _cross = np.zeros((_values.shape[1], _values.shape[1]))
+    for start in range(0, _n, chunk_size):
+        _chunk = _values[start:start + chunk_size] - _mean
+        _cross += _chunk.T @ _chunk
+    _var = np.diag(_cross).copy()
+    _scale = np.sqrt(np.outer(_var, _var))
+    corr = np.divide(_cross, _scale, out=np.full_like(_cross, np.nan), where=_scale > 0)
+    corr = pd.DataFrame(np.clip(corr, -1, 1), index=numeric.columns, columns=numeric.columns)
+    stats = pd.DataFrame({'count': _n, 'mean': _mean, 'std': np.sqrt(_var / max(_n - 1, 1)),
+                          'min': _min, 'max': _max}, index=numeric.columns)
+    if method == 'spearman':
+        stats[['mean', 'std', 'min', 'max']] = numeric.agg(['mean', 'std', 'min', 'max']).T
+    correlation_cache[key] = corr, stats
+    return corr.copy(), stats.copy()
+
+
+def correlation_plot(df, method='pearson'):
+    _root = '{}/bestModelPerformance'.format(output_root)
     if not os.path.exists(_root):
         os.makedirs(_root)
     # ---------------------------------
-    corr = df.corr()
+    corr, stats = correlation_matrix(df, method)
     plt.subplots(figsize=(12, 12))
     sns.heatmap(corr, vmin=-1, vmax=1, center=0, cmap='coolwarm', square=True)
     plt.xticks(fontsize=14)
@@ -630,30 +1368,34 @@ def correlation_plot(df):
     plt.savefig('{}/corrMatrix.png'.format(_root))
     plt.close()
     excel_output(pd.DataFrame(corr), _root, file_name='correlation', csv=False)
+    excel_output(stats, _root, file_name='statistics', csv=False)
     # ---------------------------------
     return corr
 
 
 def importance_plot(df, estimator, _x, _y):
-    _root = 'regression/bestModelPerformance'
+    _root = '{}/bestModelPerformance'.format(output_root)
     if not os.path.exists(_root):
         os.makedirs(_root)
     # ---------------------------------
     names = df.columns
-    imp = estimator.feature_importances_
-    indices = np.argsort(imp)
-    fig, ax = plt.subplots(1, figsize=(12, 9))
-    plt.barh(range(len(indices)), imp[indices], color='black', align='center')
-    x_axis_index = np.arange(0, 0.6, 0.1)
-    ax.set_xticks(x_axis_index)
-    ax.set_xticklabels(x_axis_index, fontsize=20)
-    ax.set_xticklabels(['{:.2f}'.format(i) for i in x_axis_index], fontsize=20)
-    ax.set_xlabel('Relative Importance', fontsize=30)
-    plt.yticks(range(len(indices)), [names[i] for i in indices], fontsize=14)
-    plt.tight_layout()
-    plt.savefig('{}/featuresImp.png'.format(_root))
-    plt.close()
-    excel_output(pd.DataFrame(imp), _root, file_name='rf_feature_imp', csv=False)
+    imp = None
+    # ensembles have no impurity importances, only the permutation path applies
+    if hasattr(estimator, 'feature_importances_'):
+        imp = estimator.feature_importances_
+        indices = np.argsort(imp)
+        fig, ax = plt.subplots(1, figsize=(12, 9))
+        plt.barh(range(len(indices)), imp[indices], color='black', align='center')
+        x_axis_index = np.arange(0, 0.6, 0.1)
+        ax.set_xticks(x_axis_index)
+        ax.set_xticklabels(x_axis_index, fontsize=20)
+        ax.set_xticklabels(['{:.2f}'.format(i) for i in x_axis_index], fontsize=20)
+        ax.set_xlabel('Relative Importance', fontsize=30)
+        plt.yticks(range(len(indices)), [names[i] for i in indices], fontsize=14)
+        plt.tight_layout()
+        plt.savefig('{}/featuresImp.png'.format(_root))
+        plt.close()
+        excel_output(pd.DataFrame(imp), _root, file_name='rf_feature_imp', csv=False)
     # ---------------------------------
     permute_imp_results = permutation_importance(estimator, _x, _y, scoring='neg_mean_squared_error')
     permute_imp = permute_imp_results.importances_mean
@@ -662,7 +1404,7 @@ def importance_plot(df, estimator, _x, _y):
 
 
 def parity_plot(_y_test, _y_pred, _scores):
-    _root = 'regression/bestModelPerformance'
+    _root = '{}/bestModelPerformance'.format(output_root)
     if not os.path.exists(_root):
         os.makedirs(_root)
     # ---------------------------------
@@ -703,41 +1445,47 @@ def parity_plot(_y_test, _y_pred, _scores):
     excel_output(df, _root, file_name='parityPlotData', csv=False)
 
 
-def production_plot(df_all, df_selected, _y_prod, folder_name, y_axis_scale, _exp, _seat_out):
-    _root = 'regression/postProcessing/{}{}'.format(folder_name, y_axis_scale)
+def production_plot_data(df_all, df_selected, experiments, folder_name, _off_replicas):
+    data = {}
+    groups_all = dict(tuple(df_all.loc[df_all['Experiment'].isin(experiments)].groupby('Experiment')))
+    df_rep = representative_replica(df_selected.loc[df_selected['Experiment'].isin(experiments)])
+    groups_rep = dict(tuple(df_rep.groupby('Experiment')))
+    for _exp in experiments:
+        replicas = []
+        for rep, df3 in groups_all[_exp].groupby('Description', sort=False):
+            _color, _zorder = 'gray', 0
+            if (_exp, rep) not in _off_replicas and folder_name != 'testingTheModel':
+                _color, _zorder = 'lightskyblue', 5
+            replicas.append((df3['time_hrs_original'], 10 ** (df3['corrosion_mm_yr']), _color, _zorder))
+        data[_exp] = {'replicas': replicas, 'X_prod': groups_rep[_exp]['time_hrs_original']}
+    return data
+
+
+def production_plot(df_all, df_selected, _y_prod, folder_name, y_axis_scale, _exp, _seat_out, _y_band=None,
+                    _data=None):
+    _root = '{}/postProcessing/{}{}'.format(output_root, folder_name, y_axis_scale)
     if not os.path.exists(_root):
         os.makedirs(_root)
     # ---------------------------------
+    if _data is None:
+        _data = production_plot_data(df_all, df_selected, [_exp], folder_name, off_replicas)[_exp]
     fig, ax = plt.subplots(1, figsize=(10, 9))
     # ---------------------------------
-    df2 = df_all.copy(deep=True)
-    df2 = df2.loc[df2['Experiment'] == _exp]
-    replicas = df2['Description'].unique()
     n = 1
-    for rep in replicas:
-        df3 = df2.loc[df_all['Description'] == rep]
-        _X = df3['time_hrs_original']
-        _y = 10 ** (df3['corrosion_mm_yr'])
-        _color, _zorder = 'gray', 0
-        if (_exp, rep) not in off_replicas and folder_name != 'testingTheModel':
-            _color, _zorder = 'lightskyblue', 5
+    for _X, _y, _color, _zorder in _data['replicas']:
         plt.scatter(_X, _y, c=_color, label='Replica {}'.format(n), zorder=_zorder)
         n += 1
     # ---------------------------------
-    df2 = df_selected.copy(deep=True)
-    df2 = representative_replica(df2)
-    df2 = df2.loc[df2['Experiment'] == _exp]
-    _X_prod = df2['time_hrs_original']
+    _X_prod = _data['X_prod']
     plt.scatter(_X_prod, 10 ** _y_prod, c='darkred', marker='^', s=[75], label='Prediction', zorder=7)
+    if _y_band is not None:
+        plt.fill_between(_X_prod, 10 ** _y_band[0], 10 ** _y_band[-1], color='darkred', alpha=0.2,
+                         label='Prediction interval', zorder=6)
     # ---------------------------------
     if y_axis_scale == 'Log':
         plt.yscale('log')
         # ax.yaxis.set_major_formatter(FormatStrFormatter('%.2f'))
-        if _exp == 14:
-            ax.set_ylim(0.001, 100)
-            # ax.yaxis.set_major_formatter(FormatStrFormatter('%.3f'))
-        else:
-            ax.set_ylim(0.01, 100)
+        ax.set_ylim(*y_axis_limits(_exp))
     # ---------------------------------
     # plt.text(0.02, 1.03, 'Experiment {}'.format(_exp),
     #          ha='left', va='center', transform=ax.transAxes, fontdict={'color': 'k', 'weight': 'bold', 'size': 21})
@@ -750,15 +1498,7 @@ def production_plot(df_all, df_selected, _y_prod, folder_name, y_axis_scale, _ex
     #              transform=ax.transAxes, fontdict={'color': 'k', 'weight': 'bold', 'size': 17})
     # ---------------------------------
     plt.grid(linewidth=0.5)
-    x_axis_max = 10 * (1 + int(np.max(_X_prod) / 10))
-    if _exp == 6:
-        x_axis_max = 40
-    elif _exp == 11 or _exp == 13 or _exp == 17 or _exp == 18 or _exp == 19:
-        x_axis_max = 25
-    elif _exp == 14:
-        x_axis_max = 30
-    elif _exp == 16:
-        x_axis_max = 15
+    x_axis_max = x_axis_limit(_X_prod, _exp)
     x_axis_index = np.linspace(0, x_axis_max, num=6)
     ax.set_xticks(x_axis_index)
     ax.set_xlim(0, x_axis_max)
@@ -774,14 +1514,15 @@ def production_plot(df_all, df_selected, _y_prod, folder_name, y_axis_scale, _ex
         legend_font_size = 18
     leg = plt.legend(loc='upper right', fontsize=legend_font_size, ncol=n_col, fancybox=True, shadow=True)
     for handle, text in zip(leg.legendHandles, leg.get_texts()):
-        text.set_color(handle.get_facecolor()[0])
+        _color = handle.get_facecolor()
+        text.set_color(_color[0] if np.ndim(_color) > 1 else _color)
     plt.tight_layout()
     plt.savefig('{}/{} exp{}.png'.format(_root, _info, _exp))
     plt.close()
 
 
-def sensitivity_plot(df, _exp, y_axis_scale, _feature):
-    _root = 'regression/sensitivityAnalysis/exp{}{}'.format(_exp, y_axis_scale)
+def sensitivity_plot(df, _exp, y_axis_scale, _feature, bands=None):
+    _root = '{}/sensitivityAnalysis/exp{}{}'.format(output_root, _exp, y_axis_scale)
     if not os.path.exists(_root):
         os.makedirs(_root)
     # ---------------------------------
@@ -796,29 +1537,19 @@ def sensitivity_plot(df, _exp, y_axis_scale, _feature):
             continue
         _y = 10 ** (df[column])
         plt.scatter(_X, _y, c=_color[i], marker=_marker[i], s=[75], label='{}'.format(column))
+        if bands is not None and bands.get(column) is not None:
+            plt.fill_between(_X, 10 ** bands[column][0], 10 ** bands[column][-1], color=_color[i], alpha=0.15)
         i += 1
     if y_axis_scale == 'Log':
         plt.yscale('log')
         # ax.yaxis.set_major_formatter(FormatStrFormatter('%.2f'))
-        if _exp == 14:
-            ax.set_ylim(0.001, 100)
-            # ax.yaxis.set_major_formatter(FormatStrFormatter('%.3f'))
-        else:
-            ax.set_ylim(0.01, 100)
+        ax.set_ylim(*y_axis_limits(_exp))
     # ---------------------------------
     # plt.text(0.04, 0.95, '{}'.format(_feature),
     #          ha='left', va='center', transform=ax.transAxes, fontdict={'color': 'k', 'weight': 'bold', 'size': 25})
     # ---------------------------------
     plt.grid(linewidth=0.5)
-    x_axis_max = 10 * (1 + int(np.max(_X) / 10))
-    if _exp == 6:
-        x_axis_max = 40
-    elif _exp == 11 or _exp == 13 or _exp == 17 or _exp == 18 or _exp == 19:
-        x_axis_max = 25
-    elif _exp == 14:
-        x_axis_max = 30
-    elif _exp == 16:
-        x_axis_max = 15
+    x_axis_max = x_axis_limit(_X, _exp)
     x_axis_index = np.linspace(0, x_axis_max, num=6)
     ax.set_xticks(x_axis_index)
     ax.set_xlim(0, x_axis_max)
@@ -835,158 +1566,227 @@ def sensitivity_plot(df, _exp, y_axis_scale, _feature):
     excel_output(df, _root, file_name='{}'.format(_feature), csv=False)
 
 
-# --------------------------------------------------------------------------------------------------------------------
-# BEGIN
-# --------------------------------------------------------------------------------------------------------------------
-
-# reading data
-dataAll, n_exp = read_data('dataInhibitor', new=False)
+# ----------------------------------------------------------------------------------------------------------------------
+def load_spec(path):
+    if path.endswith('.toml'):
+        if tomllib is None:
+            raise ImportError('tomllib (Python 3.11+) is required to read {}'.format(path))
+        with open(path, 'rb') as _file:
+            spec = tomllib.load(_file)
+    else:
+        if yaml is None:
+            raise ImportError('PyYAML is required to read {}'.format(path))
+        with open(path, 'r') as _file:
+            spec = yaml.safe_load(_file)
+    spec.setdefault('name', os.path.splitext(os.path.basename(path))[0])
+    return spec
+
+
+def apply_spec(spec):
+    # unspecified entries fall back to the defaults above; TOML table keys are strings, so experiments are cast
+    _sensitivity, _validation, _plot = spec.get('sensitivity', {}), spec.get('validation', {}), spec.get('plot', {})
+    run = {'name': spec.get('name', 'default'),
+           'output': spec.get('output', 'regression' if 'name' not in spec else 'regression/{}'.format(spec['name'])),
+           'data': dict({'file': 'dataInhibitor', 'new': False, 'lab': 'All'}, **spec.get('data', {})),
+           'param': dict(param_defaults, **spec.get('param', {})),
+           'models': {name: dict(models_defaults[name], **spec.get('models', {}).get(name, {}))
+                      for name in models_defaults},
+           'best': spec.get('best', 'RF'),
+           'grid': {hp: dict(grid_defaults[hp], **spec.get('grid', {}).get(hp, {})) for hp in grid_defaults},
+           'experiments': _sensitivity.get('experiments', [11]),
+           'features': _sensitivity.get('features', features_defaults),
+           'compare_replicas': _validation.get('compare_replicas', False),
+           'seat_outs': _validation.get('seat_outs', []),
+           'compaction_seat_out': _validation.get('compaction_seat_out', [12, 20, 23, 29])}
+    # ---------------------------------
+    for key in replica_defaults:
+        replica_lists[key] = [tuple(replica) for replica in spec.get('replicas', {}).get(key, replica_defaults[key])]
+    for key in ['x_axis_max', 'y_axis_log']:
+        plot_style[key] = dict(plot_defaults[key])
+        plot_style[key].update({int(_exp): value for _exp, value in _plot.get(key, {}).items()})
+    plot_style['rc'] = dict(plot_defaults['rc'], **_plot.get('rc', {}))
+    matplotlib.rcParams.update(plot_style['rc'])
+    return run
 
-# data summary (one-time output)
-# summary_data(df=dataAll)
 
 # --------------------------------------------------------------------------------------------------------------------
-# REGRESSION PROBLEM
+# BEGIN
 # --------------------------------------------------------------------------------------------------------------------
 
-# # pre-processing data
-dataSelected, off_replicas = remove_replicas(dataAll)
-inhibitor = select_features(dataSelected)
-# correlation = correlation_plot(inhibitor)
-inhibitor = encode_data(inhibitor)
-#
-# grid-search to find the best model of each algorithm (one-time output)
-if param['grid_search']:
-    root = 'regression/gridSearchModels'
-    if not os.path.exists(root):
-        os.makedirs(root)
-    # ---------------------------------
-    best_models = {}
-    df_scores = pd.DataFrame()
-    for algorithm in ['MLP', 'SVM', 'RF', 'KNN']:
-        print(algorithm)
-        algorithms = grid_search(algorithm)
-        scores, best = compare_models(inhibitor, algorithms, param)
-        best_models[algorithm] = best
-        df_scores['{}_mean'.format(algorithm)], df_scores['{}_std'.format(algorithm)] = scores['mean'], scores['std']
-        printOut = pd.DataFrame(algorithms)
-        printOut['mean'], printOut['std'] = [-x for x in scores['mean']], scores['std']
-        excel_output(printOut, root, file_name='{}'.format(algorithm), csv=False)
-    compare_models_plot(df_scores)
-    models_reg = [('MLP', best_models['MLP']),
-                  ('SVM', best_models['SVM']),
-                  ('RF', best_models['RF']),
-                  ('KNN', best_models['KNN'])]
-else:
-    models_reg = [('MLP', MLPRegressor(hidden_layer_sizes=(8, 8, 8, 8), max_iter=10000)),
-                  ('SVM', SVR(C=1000, gamma=1)),
-                  ('RF', RandomForestRegressor(max_features=0.7, n_estimators=500, random_state=5)),
-                  ('KNN', KNeighborsRegressor(n_neighbors=3, weights='distance'))]
-
-# comparing different models
-_best_reg = models_reg[2][1]
-if param['compare_models']:
-    scores_reg, _best_reg = compare_models(inhibitor, models_reg, param)
-    compare_models_box_plot(scores_reg, param)
-    excel_output(scores_reg, 'regression/gridSearchModels', file_name='comparison', csv=False)
-best_reg = _best_reg
-
-# # features importance
-# X, y = split_xy(inhibitor, True)
-# best_reg.fit(X, y)
-# feature_importance, permute_importance = importance_plot(inhibitor, best_reg)
-#
-# # parity plot
-# training_reg, testing_reg = split_data_random(inhibitor, param['test_size'])
-# X_train, y_train = split_xy(training_reg, True)
-# best_reg.fit(X_train, y_train)
-# X_test, y_test = split_xy(testing_reg, True)
-# y_pred = best_reg.predict(X_test)
-# scores_pred = prediction(inhibitor, best_reg, param)
-# parity_plot(y_test, y_pred, scores_pred)
-# excel_output(X_train, 'regression/bestModelPerformance', file_name='trainFeatureMatrixNorm', csv=False)
-
-# # comparing replicas when 1 experiment is out each time
-# experiments = [int(i) for i in inhibitor['Experiment'].unique()]
-# for exp in experiments:
-#     print(exp)
-#     seatOut = np.asarray([exp])
-#     training_comp, testing_comp = split_data_exp(inhibitor, seatOut)
-#     X_train, y_train = split_xy(training_comp, True)
-#     X_test, y_test = split_xy(testing_comp, False)
-#     best_reg.fit(X_train, y_train)
-#     X_prod, y_prod = production(X_test, y_test)
-#     y_pred = best_reg.predict(X_prod)
-#     production_plot(dataAll, dataSelected, y_pred, 'compareReplicas', 'Log', exp, seatOut)
-#     production_plot(dataAll, dataSelected, y_pred, 'compareReplicas', 'Normal', exp, seatOut)
-
-# testing the model when 4 experiment (25% of the data) are out
-# seatOuts = [[2, 17, 27, 29], [4, 7, 14, 24], [4, 8, 10, 12], [10, 23, 24, 27], [12, 14, 17, 20], [11, 12, 13, 17],
-#             [1, 10, 12, 28], [2, 6, 13, 18], [9, 11, 13, 20], [11, 13, 15, 23], [1, 13, 15, 29], [10, 15, 18, 20],
-#             [1, 8, 15, 28], [12, 20, 23, 29]]
-# experiments = inhibitor['Experiment'].unique()
-# seatOuts = [[int(i) for i in np.random.choice(a=experiments, size=4, replace=False)], [12, 20, 23, 29]]
-# for seatOut in seatOuts:
-#     training_test, testing_test = split_data_exp(inhibitor, seatOut)
-#     X_train, y_train = split_xy(training_test, True)
-#     best_reg.fit(X_train, y_train)
-#     for exp in seatOut:
-#         testing_temp = testing_test.loc[testing_test['Experiment'] == exp].reset_index(drop=True)
-#         X_test, y_test = split_xy(testing_temp, False)
-#         X_prod, y_prod = production(X_test, y_test)
-#         y_pred = best_reg.predict(X_prod)
-#         production_plot(dataAll, dataSelected, y_pred, 'testingTheModel', 'Log', exp, seatOut)
-#         production_plot(dataAll, dataSelected, y_pred, 'testingTheModel', 'Normal', exp, seatOut)
-
-# sensitivity analysis
-experiments = [11]
-# experiments = [int(i) for i in inhibitor['Experiment'].unique()]
-# experiment = [i for i in np.random.choice(a=experiments, size=1, replace=False)]
-features_reg = {'CI': [['CORR12148SP', 'EC1612A'], [0.0, 0.0], 'Corrosion inhibitor', 'CI', ''],
-                'pH': [['Controlled=6', 'Uncontrolled'], [0.0, 0.0], 'pH', 'pH', ''],
-                'Brine_Type': [['TH', 'Galapagos'], [0.0, 0.0], 'Brine type', 'type', ''],
-                'Pressure_bar_CO2': [[0.5, 5, 12], [4.51, 3.15], 'CO2 partial pressure', 'P_CO2', 'bar'],
-                'Temperature_C': [[90, 110, 132], [106.69, 19.34], 'Temperature', 'T', 'C'],
-                'Shear_Pa': [[20, 100, 300], [32.85, 56.01], 'Shear stress', 'P', 'Pa'],  # mean, sdv = 32.85, 56.01
-                'Brine_Ionic_Strength': [[0.5, 1.5, 2.5], [0.87, 0.62], 'Brine ionic strength', 'S', ''],
-                'concentration_ppm': [[100, 200, 300], [190.21, 131.99],
-                                      'Inhibitor concentration', 'C', 'ppm']}
-for experiment in experiments:
-    print(experiment)
-    training_sens, testing_sens = split_data_exp(inhibitor, [experiment])
-    X_train, y_train = split_xy(inhibitor, True)
-    best_reg.fit(X_train, y_train)
-    testing_sens, time_sens = sensitivity(dataSelected, testing_sens, experiment)
-    for key in features_reg:
-        print(key)
-        first = True
-        sensitivity_df = pd.DataFrame(index=range(len(testing_sens)))
-        sensitivity_df['time_hrs'] = time_sens
-        for value in features_reg[key][0]:
-            testing_temp = testing_sens.copy(deep=True)
-            if first and key in ['CI', 'pH', 'Brine_Type']:
-                testing_temp['{}_{}'.format(key, features_reg[key][0][0])] = [1.0] * len(testing_sens)
-                testing_temp['{}_{}'.format(key, features_reg[key][0][1])] = [0.0] * len(testing_sens)
-                first = False
-            elif key in ['CI', 'pH', 'Brine_Type']:
-                testing_temp['{}_{}'.format(key, features_reg[key][0][0])] = [0.0] * len(testing_sens)
-                testing_temp['{}_{}'.format(key, features_reg[key][0][1])] = [1.0] * len(testing_sens)
-            else:
-                key_mean, key_std = np.mean(dataSelected[key]), np.std(dataSelected[key])
-                zero_norm = (0 - key_mean) / float(key_std)
-                value_norm = (value - key_mean) / float(key_std)
-                if key != 'concentration_ppm':
-                    testing_temp[key] = [value_norm] * len(testing_sens)
+# run specs (YAML/TOML) given on the command line, or the defaults above; loaded data and fitted models are shared
+specs = [load_spec(path) for path in sys.argv[1:]] or [{}]
+data_cache, model_cache = {}, {}
+for spec in specs:
+    runSpec = apply_spec(spec)
+    param, features_reg, output_root = runSpec['param'], runSpec['features'], runSpec['output']
+    print(runSpec['name'])
+
+    # reading data
+    key_data = (runSpec['data']['file'], runSpec['data']['new'], param['monitor'], param['monitor_strict'])
+    if key_data not in data_cache:
+        data_cache[key_data] = read_data(runSpec['data']['file'], new=runSpec['data']['new'], monitor=param['monitor'],
+                                         strict=param['monitor_strict'])
+    dataAll, n_exp = data_cache[key_data]
+    dataAll = filter_lab(dataAll, runSpec['data']['lab'])
+
+    # data summary (one-time output)
+    # summary_data(df=dataAll)
+
+    # ----------------------------------------------------------------------------------------------------------------
+    # REGRESSION PROBLEM
+    # ----------------------------------------------------------------------------------------------------------------
+
+    # # pre-processing data
+    key_pre = (key_data, runSpec['data']['lab'], tuple(replica_lists['off']), param['time_features'],
+               param['feature_window'])
+    if key_pre not in data_cache:
+        dataSelected, off_replicas = remove_replicas(dataAll)
+        if param['time_features']:
+            dataSelected = time_features(dataSelected, param['feature_window'])
+        inhibitor = select_features(dataSelected, param['time_features'])
+        inhibitor = encode_data(inhibitor)
+        # correlation = correlation_plot(inhibitor)
+        data_cache[key_pre] = dataSelected, off_replicas, inhibitor
+    dataSelected, off_replicas, inhibitor = data_cache[key_pre]
+    #
+    # grid-search to find the best model of each algorithm (one-time output)
+    if param['grid_search']:
+        root = '{}/gridSearchModels'.format(output_root)
+        if not os.path.exists(root):
+            os.makedirs(root)
+        # ---------------------------------
+        best_models = {}
+        df_scores = pd.DataFrame()
+        for algorithm in ['MLP', 'SVM', 'RF', 'KNN']:
+            print(algorithm)
+            algorithms = grid_search(algorithm, runSpec['grid'])
+            scores, best = compare_models(inhibitor, algorithms, param)
+            best_models[algorithm] = best
+            df_scores['{}_mean'.format(algorithm)] = scores['mean']
+            df_scores['{}_std'.format(algorithm)] = scores['std']
+            printOut = pd.DataFrame(algorithms)
+            printOut['mean'], printOut['std'] = [-x for x in scores['mean']], scores['std']
+            excel_output(printOut, root, file_name='{}'.format(algorithm), csv=False)
+        compare_models_plot(df_scores)
+        models_reg = [('MLP', best_models['MLP']),
+                      ('SVM', best_models['SVM']),
+                      ('RF', best_models['RF']),
+                      ('KNN', best_models['KNN'])]
+    else:
+        models_reg = build_models(runSpec['models'])
+
+    # comparing different models
+    _best_reg = dict(models_reg)[runSpec['best']]
+    if param['compare_models']:
+        scores_reg, _best_reg = compare_models(inhibitor, models_reg, param)
+        compare_models_box_plot(scores_reg, param)
+        excel_output(scores_reg, '{}/gridSearchModels'.format(output_root), file_name='comparison', csv=False)
+    best_reg = _best_reg
+
+    # model-size and latency trade-off of the deployed forest on the grouped validation split
+    if param['compaction']:
+        compaction_report = compact_forest(inhibitor, best_reg, runSpec['compaction_seat_out'], param)
+
+    # stacking/averaging ensemble of the four tuned models in place of the single best one
+    if param['ensemble']:
+        best_reg = EnsembleRegressor(models_reg, param['ensemble_mode'], param['cv'], param['n_jobs'])
+
+    # # features importance
+    # X, y = split_xy(inhibitor, True)
+    # best_reg.fit(X, y)
+    # feature_importance, permute_importance = importance_plot(inhibitor, best_reg)
+    #
+    # # parity plot
+    # training_reg, testing_reg = split_data_random(inhibitor, param['test_size'])
+    # X_train, y_train = split_xy(training_reg, True)
+    # best_reg.fit(X_train, y_train)
+    # X_test, y_test = split_xy(testing_reg, True)
+    # y_pred = best_reg.predict(X_test)
+    # scores_pred = prediction(inhibitor, best_reg, param)
+    # parity_plot(y_test, y_pred, scores_pred)
+    # excel_output(X_train, '{}/bestModelPerformance'.format(output_root), file_name='trainFeatureMatrixNorm',
+    #              csv=False)
+
+    # comparing replicas when 1 experiment is out each time
+    if runSpec['compare_replicas']:
+        experiments = [int(i) for i in inhibitor['Experiment'].unique()]
+        seatOuts = [[exp] for exp in experiments]
+        predictions_comp = validation_batch(inhibitor, dataAll, dataSelected, best_reg, seatOuts, 'compareReplicas',
+                                            off_replicas, param, model_cache)
+
+    # testing the model when 4 experiment (25% of the data) are out, e.g.
+    # [[2, 17, 27, 29], [4, 7, 14, 24], [4, 8, 10, 12], [10, 23, 24, 27], [12, 14, 17, 20], [11, 12, 13, 17],
+    #  [1, 10, 12, 28], [2, 6, 13, 18], [9, 11, 13, 20], [11, 13, 15, 23], [1, 13, 15, 29], [10, 15, 18, 20],
+    #  [1, 8, 15, 28], [12, 20, 23, 29]]; the entry 'random' draws 4 experiments with the seeded generator
+    if runSpec['seat_outs']:
+        experiments = inhibitor['Experiment'].unique()
+        rng = np.random.default_rng(param['seed'])
+        seatOuts = [[int(i) for i in rng.choice(a=experiments, size=4, replace=False)] if seatOut == 'random'
+                    else seatOut for seatOut in runSpec['seat_outs']]
+        predictions_test = validation_batch(inhibitor, dataAll, dataSelected, best_reg, seatOuts, 'testingTheModel',
+                                            off_replicas, param, model_cache)
+
+    # sensitivity analysis; the what-if rows change the dose but not the lag/rolling/exposure features measured on
+    # the real run, so with time features on those inputs would contradict each other
+    experiments = runSpec['experiments']
+    if param['time_features'] and (experiments or param['scenario_sweep']):
+        print('WARNING: {} - time features are on, sensitivity and scenario sweeps are skipped'.format(runSpec['name']))
+        experiments, param['scenario_sweep'] = [], False
+    # experiments = [int(i) for i in inhibitor['Experiment'].unique()]
+    # experiment = [i for i in np.random.default_rng(param['seed']).choice(a=experiments, size=1, replace=False)]
+    for experiment in experiments:
+        print(experiment)
+        training_sens, testing_sens = split_data_exp(inhibitor, [experiment])
+        X_train, y_train = split_xy(inhibitor, True, param['seed'])
+        fitted_reg = fit_cached(best_reg, X_train, y_train, model_cache)
+        testing_sens, time_sens = sensitivity(dataSelected, testing_sens, experiment)
+        for key in features_reg:
+            print(key)
+            first = True
+            sensitivity_df = pd.DataFrame(index=range(len(testing_sens)))
+            bands_sens = {}
+            sensitivity_df['time_hrs'] = time_sens
+            for value in features_reg[key][0]:
+                testing_temp = testing_sens.copy(deep=True)
+                if first and key in ['CI', 'pH', 'Brine_Type']:
+                    testing_temp['{}_{}'.format(key, features_reg[key][0][0])] = [1.0] * len(testing_sens)
+                    testing_temp['{}_{}'.format(key, features_reg[key][0][1])] = [0.0] * len(testing_sens)
+                    first = False
+                elif key in ['CI', 'pH', 'Brine_Type']:
+                    testing_temp['{}_{}'.format(key, features_reg[key][0][0])] = [0.0] * len(testing_sens)
+                    testing_temp['{}_{}'.format(key, features_reg[key][0][1])] = [1.0] * len(testing_sens)
                 else:
-                    for v in range(len(testing_temp)):
-                        if testing_temp.loc[v, 'concentration_ppm'] != 0:
-                            testing_temp.loc[v, 'concentration_ppm'] = value
-            X_sens = testing_temp.drop(['Description', 'Experiment', 'corrosion_mm_yr'], axis=1)
-            y_sens = best_reg.predict(X_sens)
-            value = 130 if value == 132 else value
-            sensitivity_df['{} = {} {}'.format(features_reg[key][3], value, features_reg[key][4])] = y_sens
-        sensitivity_plot(sensitivity_df, experiment, 'Log', features_reg[key][2])
-        sensitivity_plot(sensitivity_df, experiment, 'Normal', features_reg[key][2])
+                    key_mean, key_std = np.mean(dataSelected[key]), np.std(dataSelected[key])
+                    zero_norm = (0 - key_mean) / float(key_std)
+                    value_norm = (value - key_mean) / float(key_std)
+                    if key != 'concentration_ppm':
+                        testing_temp[key] = [value_norm] * len(testing_sens)
+                    else:
+                        for v in range(len(testing_temp)):
+                            if testing_temp.loc[v, 'concentration_ppm'] != 0:
+                                testing_temp.loc[v, 'concentration_ppm'] = value
+                X_sens = testing_temp.drop(['Description', 'Experiment', 'corrosion_mm_yr'], axis=1)
+                value = 130 if value == 132 else value
+                label_sens = '{} = {} {}'.format(features_reg[key][3], value, features_reg[key][4])
+                y_sens, bands_sens[label_sens] = interval_prediction(fitted_reg, X_sens, param, X_train, y_train)
+                sensitivity_df[label_sens] = y_sens
+            sensitivity_plot(sensitivity_df, experiment, 'Log', features_reg[key][2], bands_sens)
+            sensitivity_plot(sensitivity_df, experiment, 'Normal', features_reg[key][2], bands_sens)
+
+    # what-if sweep over the full factorial of the sensitivity grid (streamed in bounded memory)
+    if param['scenario_sweep']:
+        X_train, y_train = split_xy(inhibitor, True, param['seed'])
+        fitted_reg = fit_cached(best_reg, X_train, y_train, model_cache)
+        grid_sweep = {key: features_reg[key][0] for key in features_reg}
+        experiments_sweep = [int(i) for i in inhibitor['Experiment'].unique()] if param['sweep_all'] else experiments
+        for experiment in experiments_sweep:
+            print(experiment)
+            training_sweep, testing_sweep = split_data_exp(inhibitor, [experiment])
+            testing_sweep, time_sweep = sensitivity(dataSelected, testing_sweep, experiment)
+            chunks_sweep = scenario_chunks(testing_sweep, grid_sweep, dataSelected, param['sweep_chunk_size'],
+                                           time_sweep)
+            predict_chunked(fitted_reg, chunks_sweep, '{}/scenarioSweeps'.format(output_root),
+                            'exp{}'.format(experiment), param)
 
 # ----------------------------------------------------------------------------------------------------------------------
 # The End